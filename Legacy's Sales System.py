@@ -1,9 +1,14 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv
 import plotly.express as px
+import plotly.graph_objects as go
 from datetime import date
 import pathlib
+import hashlib
 import os
 import io # Import io for capturing info() output
 
@@ -15,6 +20,48 @@ DATA_FILE_NAME = 'Sales Dataset.csv'
 REQUIRED_COLS = ['Date', 'Client_Name', 'Store_ID', 'Store_State', 'Category', 'Price_Band', 'Quantity_Sold', 'Customer_Service_Score', 'Festival']
 # Columns to show in hover data for maximum detail
 HOVER_COLS = ['Client_Name', 'Store_ID', 'Store_State', 'Category', 'Price_Band', 'Customer_Service_Score', 'Festival']
+# Pinned Arrow types for the CSV reader (dictionary-encoded text becomes pandas Categorical).
+# Arrow's CSV reader only supports int32 dictionary indices; to_pandas() shrinks the codes anyway.
+CSV_COLUMN_TYPES = {
+    'Date': pa.string(),  # parsed per row after the read, see DATE_FORMATS
+    'Quantity_Sold': pa.int32(),
+    'Customer_Service_Score': pa.float32(),
+    'Category': pa.dictionary(pa.int32(), pa.string()),
+    'Price_Band': pa.dictionary(pa.int32(), pa.string()),
+    'Store_State': pa.dictionary(pa.int32(), pa.string()),
+    'Client_Name': pa.dictionary(pa.int32(), pa.string()),
+    'Festival': pa.dictionary(pa.int32(), pa.string()),
+}
+# Text treated as missing, matching pd.read_csv's defaults (e.g. Festival == 'None' means no festival)
+CSV_NULL_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                   '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+# Accepted date formats (DD-MM-YYYY or YYYY-MM-DD)
+DATE_FORMATS = ['%d-%m-%Y', '%Y-%m-%d']
+# Text columns stored as pandas Categorical (or Arrow strings when their cardinality is too high)
+CATEGORICAL_COLS = ['Client_Name', 'Store_ID', 'Store_State', 'Category', 'Price_Band', 'Festival', 'Season', 'Month_Year']
+CATEGORICAL_MAX_UNIQUE = 1000
+# Natural order of the price bands (any unlisted band is appended after these)
+PRICE_BAND_ORDER = ['Low (0-20k)', 'Medium (20k-50k)', 'High (50k+)', 'Premium (1L+)']
+# Maximum number of clients drawn in the Q4/Q5/Q6 treemap when no client is selected
+TREEMAP_TOP_CLIENTS = 20
+# Entries kept by each filtered-aggregation cache (one per data key x client x category x time column)
+FILTERED_CACHE_MAX_ENTRIES = 64
+# Time aggregation choices offered on the analytics page (label -> column)
+TIME_AGG_OPTIONS = {
+    'Monthly': 'Month_Year', 
+    'Yearly': 'Year', 
+    'Seasonal': 'Season', 
+    'Festival': 'Festival' 
+}
+# Season lookup indexed by month number (index 0 is unused)
+_SEASON_LUT = np.array([
+    'N/A',
+    'Winter', 'Winter',                                       # Jan, Feb
+    'Spring/Summer', 'Spring/Summer', 'Spring/Summer',        # Mar - May
+    'Monsoon', 'Monsoon', 'Monsoon',                          # Jun - Aug
+    'Autumn/Festival', 'Autumn/Festival', 'Autumn/Festival',  # Sep - Nov
+    'Winter',                                                 # Dec
+], dtype=object)
 
 st.set_page_config(
     page_title="Legacy Jewel's Sales Analytics System",
@@ -29,50 +76,202 @@ def display_footer():
     st.markdown("---")
     st.markdown(f"<p style='text-align: right; font-size: small; color: grey;'>Developed by {DEVELOPER_NAME}</p>", unsafe_allow_html=True)
 
+# --- Home Page Image Lookup ---
+# Streamlit re-executes this script on every rerun, so the lookup is cached for the server process.
+@st.cache_resource(show_spinner=False)
+def home_image_path():
+    """Resolves the home page image once; returns None when the file is missing."""
+    image_path = (pathlib.Path(__file__).parent / IMAGE_FILE).resolve()
+    return image_path if image_path.exists() else None
+
 # --- Data Loading and Processing Function ---
-@st.cache_data
+def precompute_full_data_aggregates(df):
+    """Builds the aggregations that depend only on the full data (never on the page filters)."""
+    client_growth_by = {}
+    for col in TIME_AGG_OPTIONS.values():
+        client_growth = df.groupby(col, observed=True)['Client_Name'].nunique().reset_index()
+        client_growth.columns = [col, 'Client_Count']
+        client_growth['Client_Change_%'] = client_growth['Client_Count'].pct_change() * 100
+        client_growth_by[col] = client_growth
+
+    return {
+        'client_sales': df.groupby('Client_Name', observed=True)['Quantity_Sold'].sum(),
+        'category_sales': df.groupby('Category', observed=True)['Quantity_Sold'].sum(),
+        'service_scatter': df.groupby('Client_Name', observed=True).agg(
+            Avg_Service_Score=('Customer_Service_Score', 'mean'),
+            Total_Sales=('Quantity_Sold', 'sum')
+        ).reset_index(),
+        # Q3 frames, ready to plot, for every time aggregation
+        'client_growth_by': client_growth_by,
+    }
+
+def set_table_column(table, name, values):
+    """Sets an Arrow table column, replacing a column of the same name already read from the file."""
+    if name in table.column_names:
+        return table.set_column(table.column_names.index(name), name, values)
+    return table.append_column(name, values)
+
+# Persisted to disk so server restarts reuse the processed frames instead of re-parsing the CSV.
+# max_entries only bounds the in-memory copies: the pickles in Streamlit's cache folder (~/.streamlit/cache)
+# stay on disk until load_and_process_data.clear() runs (see the "Clear Cached Uploads" button on the uploader page).
+@st.cache_data(persist="disk", show_spinner="Processing sales data...", max_entries=4)
 def load_and_process_data(file_content):
     """Loads the historical data and performs essential preprocessing."""
     try:
-        # Use low_memory=False for safety since the structure is complex
-        df = pd.read_csv(file_content, low_memory=False)
+        # Parse with the multi-threaded Arrow reader; dtypes are resolved during the parse
+        table = pa.csv.read_csv(
+            file_content,
+            convert_options=pa.csv.ConvertOptions(
+                column_types=CSV_COLUMN_TYPES, null_values=CSV_NULL_VALUES, strings_can_be_null=True
+            )
+        )
         
         # 1. Validation Check
-        missing_cols = [col for col in REQUIRED_COLS if col not in df.columns]
+        missing_cols = [col for col in REQUIRED_COLS if col not in table.column_names]
         if missing_cols:
             st.error(f"Missing required columns in the uploaded file: {', '.join(missing_cols)}")
-            return pd.DataFrame(), pd.DataFrame() 
+            return pd.DataFrame(), pd.DataFrame(), {} 
             
-        # 2. Convert Date and create time columns
-        # Robustly handle date formats (assuming DD-MM-YYYY or YYYY-MM-DD)
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        df = df.dropna(subset=['Date'])
+        # 2. Convert Date and create time columns with Arrow compute kernels
+        # Robustly handle date formats: a row matching none of DATE_FORMATS becomes null and is dropped
+        parsed_dates = pc.coalesce(*[
+            pc.strptime(table['Date'], format=fmt, unit='ns', error_is_null=True) for fmt in DATE_FORMATS
+        ])
+        table = set_table_column(table, 'Date', parsed_dates)
+        table = table.filter(pc.is_valid(table['Date']))
+        table = set_table_column(table, 'Year', pc.year(table['Date']).cast(pa.int16()))
+        # 'YYYY-MM' labels formatted by Arrow's vectorized kernel and dictionary-encoded (pandas' dt.strftime is per element)
+        table = set_table_column(table, 'Month_Year', pc.dictionary_encode(pc.strftime(table['Date'], format='%Y-%m')))
+        months = pc.month(table['Date']).to_numpy()
         
-        df['Year'] = df['Date'].dt.year
-        df['Month_Year'] = df['Date'].dt.to_period('M').astype(str)
+        # Convert to pandas only once, after the Arrow-side work is done
+        df = table.to_pandas()
         
-        # 3. Define seasons
-        def get_season(month):
-            if month in [3, 4, 5]: return 'Spring/Summer'
-            if month in [6, 7, 8]: return 'Monsoon'
-            if month in [9, 10, 11]: return 'Autumn/Festival'
-            if month in [12, 1, 2]: return 'Winter'
-            return 'N/A'
+        # 3. Define seasons (single vectorized lookup by month number)
+        df['Season'] = _SEASON_LUT[months]
         
-        df['Season'] = df['Date'].dt.month.apply(get_season)
+        # Downcast numeric columns to the smallest type that holds their values (groupby sums still widen to int64).
+        # The reader already pins Quantity_Sold/Customer_Service_Score to int32/float32 and rejects values outside int32.
+        for col in df.select_dtypes(include='integer').columns.difference(['Year']):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+        for col in df.select_dtypes(include='float').columns:
+            df[col] = pd.to_numeric(df[col], downcast='float')
+        
+        # Store text columns as Categorical so groupbys hash integer codes instead of strings;
+        # high-cardinality columns use contiguous Arrow strings instead of Python objects
+        for col in CATEGORICAL_COLS:
+            if col != 'Price_Band' and df[col].nunique() > CATEGORICAL_MAX_UNIQUE:
+                df[col] = df[col].astype('string[pyarrow]')
+            else:
+                df[col] = df[col].astype('category')
+                # Arrow dictionaries keep first-seen order; sort so groupby output does not depend on row order
+                if col != 'Price_Band':
+                    df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+        bands = df['Price_Band'].cat.categories
+        band_order = [b for b in PRICE_BAND_ORDER if b in bands] + [b for b in bands if b not in PRICE_BAND_ORDER]
+        df['Price_Band'] = df['Price_Band'].cat.set_categories(band_order, ordered=True)
         
         # 4. Generate Store History (Requirement 2)
-        store_history = df[['Date', 'Store_ID', 'Client_Name', 'Year']].drop_duplicates()
         # For Store Count, we calculate yearly store count per client first, then sum up for the total store count in the required graph.
-        store_count_yearly = store_history.groupby(['Client_Name', 'Year'])['Store_ID'].nunique().reset_index()
-        store_count_yearly.columns = ['Client_Name', 'Year', 'Store_Count']
+        # nunique already ignores duplicate rows, so no de-duplicated copy of the frame is needed.
+        store_count_yearly = (
+            df.groupby(['Client_Name', 'Year'], observed=True)['Store_ID'].nunique().reset_index(name='Store_Count')
+        )
         
-        st.success(f"Data processed successfully! Loaded {len(df):,} transactions over {df['Year'].nunique()} years.")
-        return df, store_count_yearly
+        # 5. Pre-compute the full-data aggregations reused by the pages on every rerun
+        precomputed = precompute_full_data_aggregates(df)
+        
+        return df, store_count_yearly, precomputed
     
     except Exception as e:
         st.error(f"Error processing data. Check file format and content. Error: {e}")
-        return pd.DataFrame(), pd.DataFrame()
+        return pd.DataFrame(), pd.DataFrame(), {}
+
+# One shared copy of the processed data per upload (not per session); sessions only keep the `data_key`.
+@st.cache_resource(max_entries=4, show_spinner=False)
+def load_dataset_by_key(data_key, _file_content=None):
+    """Returns (data, store history, pre-computed aggregates) for the upload identified by `data_key`."""
+    if _file_content is None:
+        # Nothing to rebuild the data from; raising keeps this miss out of the cache
+        raise KeyError(data_key)
+    return load_and_process_data(_file_content)
+
+def get_dataset():
+    """Looks up the current session's processed data, or empty placeholders if nothing is loaded."""
+    data_key = st.session_state.get('data_key')
+    if data_key is not None:
+        try:
+            return load_dataset_by_key(data_key)
+        except KeyError:
+            st.session_state['data_key'] = None
+    return pd.DataFrame(), pd.DataFrame(), {}
+
+# --- Filtered Aggregations (cached per filter selection) ---
+def filter_data(df, selected_client, selected_category):
+    """Applies the client/category filters with one combined mask (no copy when nothing is filtered)."""
+    mask = None
+    if selected_client != 'All':
+        mask = (df['Client_Name'] == selected_client)
+    if selected_category != 'All':
+        category_mask = (df['Category'] == selected_category)
+        mask = category_mask if mask is None else (mask & category_mask)
+    return df if mask is None else df.loc[mask]
+
+# `_df` is skipped by Streamlit's hasher; `data_key` identifies the uploaded data instead.
+@st.cache_data(show_spinner=False, max_entries=FILTERED_CACHE_MAX_ENTRIES)
+def category_sales_by_time(_df, data_key, selected_client, selected_category, time_col):
+    """Q1/Q8: quantity sold per time period and category, with the period-over-period % change."""
+    df_filtered = filter_data(_df, selected_client, selected_category)
+    sales_by_time = df_filtered.groupby([time_col, 'Category'], observed=True)['Quantity_Sold'].sum().reset_index()
+    
+    # Grouped % change in one vectorized pass: sort so each category's periods are adjacent,
+    # then compare every row with the previous one when both belong to the same category.
+    sales_by_time = sales_by_time.sort_values(['Category', time_col], ignore_index=True)
+    category_codes, _ = pd.factorize(sales_by_time['Category'])
+    quantities = sales_by_time['Quantity_Sold'].to_numpy(dtype=np.float64)
+    has_previous = np.zeros(len(quantities), dtype=bool)
+    has_previous[1:] = (category_codes[1:] == category_codes[:-1]) & (quantities[:-1] != 0)
+    previous = np.roll(quantities, 1)
+    sales_change = np.zeros(len(quantities))
+    sales_change[has_previous] = (quantities[has_previous] - previous[has_previous]) / previous[has_previous] * 100
+    sales_by_time['Sales_Change_%'] = sales_change
+    # Back to time order: plotly lays out the (string) time axis in order of first appearance
+    return sales_by_time.sort_values([time_col, 'Category'], ignore_index=True)
+
+@st.cache_data(show_spinner=False, max_entries=FILTERED_CACHE_MAX_ENTRIES)
+def client_taste_by_time(_df, data_key, selected_client, selected_category, time_col):
+    """Q4/Q5/Q6: quantity sold per client, time period and category, plus whether any clients were left out."""
+    df_filtered = filter_data(_df, selected_client, selected_category)
+    taste_df = df_filtered.groupby(['Client_Name', time_col, 'Category'], observed=True)['Quantity_Sold'].sum().reset_index()
+    clients_omitted = False
+    if selected_client == 'All':
+        # Keep the treemap responsive: only the top clients by quantity are drawn
+        client_totals = taste_df.groupby('Client_Name', observed=True)['Quantity_Sold'].sum()
+        clients_omitted = len(client_totals) > TREEMAP_TOP_CLIENTS
+        if clients_omitted:
+            taste_df = taste_df[taste_df['Client_Name'].isin(client_totals.nlargest(TREEMAP_TOP_CLIENTS).index)]
+    return taste_df, clients_omitted
+
+@st.cache_data(show_spinner=False, max_entries=FILTERED_CACHE_MAX_ENTRIES)
+def price_band_sales_by_time(_df, data_key, selected_client, selected_category, time_col):
+    """Q9: quantity sold per price band and time period."""
+    df_filtered = filter_data(_df, selected_client, selected_category)
+    return df_filtered.groupby(['Price_Band', time_col], observed=True)['Quantity_Sold'].sum().reset_index()
+
+def plot_frame(agg, columns, str_cols):
+    """Trims an aggregate to the non-zero rows and the columns a chart needs, casting only `str_cols` to text."""
+    plot_df = agg.loc[agg['Quantity_Sold'] > 0, columns].copy()
+    for col in str_cols:
+        plot_df[col] = plot_df[col].astype(str)
+    return plot_df
+
+def top_n(series, n=10, largest=True):
+    """Returns the n largest (or smallest) values of a Series, sorted, using a partial sort."""
+    if len(series) > n:
+        values = series.to_numpy()
+        positions = np.argpartition(values, -n)[-n:] if largest else np.argpartition(values, n)[:n]
+        series = series.iloc[positions]
+    return series.sort_values(ascending=not largest)
 
 # --- Page Definitions ---
 
@@ -88,11 +287,9 @@ def page_home():
     
     st.subheader("Explore Our Premium Collection")
     
-    current_dir = pathlib.Path(__file__).parent
-    image_path = current_dir / IMAGE_FILE
-    
-    if image_path.exists():
-        st.image(str(image_path.resolve()), use_container_width=True, caption=f"Designed 3D Jewellery Render: {IMAGE_FILE}")
+    image_path = home_image_path()
+    if image_path is not None:
+        st.image(str(image_path), use_container_width=True, caption=f"Designed 3D Jewellery Render: {IMAGE_FILE}")
     else:
         # Use a placeholder path if the specific image file is not confirmed
         st.warning(f"Image file '{IMAGE_FILE}' not found. Using a placeholder image.")
@@ -109,15 +306,16 @@ def page_uploader():
     
     uploaded_file = st.file_uploader("Upload your 3-Year Historical Sales Data (CSV)", type=['csv'])
 
-    df_current = st.session_state.get('analytical_data', pd.DataFrame())
-
     if uploaded_file is not None:
-        # Load and process the uploaded file
-        df_new, df_stores_new = load_and_process_data(uploaded_file)
+        # Load and process the uploaded file; the session only stores a digest of its bytes
+        data_key = hashlib.blake2b(uploaded_file.getvalue(), digest_size=16).hexdigest()
+        df_new, _, _ = load_dataset_by_key(data_key, uploaded_file)
         if not df_new.empty:
-            st.session_state['analytical_data'] = df_new
-            st.session_state['store_history'] = df_stores_new
-            df_current = df_new
+            st.session_state['data_key'] = data_key
+            # Shown here rather than in the cached loaders, whose elements replay on every cache hit
+            st.success(f"Data processed successfully! Loaded {len(df_new):,} transactions over {df_new['Year'].nunique()} years.")
+
+    df_current, _, precomputed = get_dataset()
             
     # Display Summary
     if not df_current.empty:
@@ -133,7 +331,7 @@ def page_uploader():
         
         # --- Top Clients ---
         st.markdown("### Top Clients by Quantity Sold (Overall)")
-        top_clients = df_current.groupby('Client_Name')['Quantity_Sold'].sum().nlargest(10).reset_index()
+        top_clients = top_n(precomputed['client_sales']).reset_index()
         st.dataframe(top_clients, use_container_width=True)
 
         st.markdown("---")
@@ -154,29 +352,39 @@ def page_uploader():
         st.markdown("### Data Structure & Quality (Text/Categorical Data)")
         st.info("This table shows the **type** of data in each column and highlights if there are any **missing values**.")
         
-        data_quality_df = []
-        for col in df_current.columns:
-            data_quality_df.append({
-                'Column Name': col,
-                'Data Type': str(df_current[col].dtype),
-                'Non-Null Count': df_current[col].count(),
-                'Unique Values': df_current[col].nunique(),
-                'Missing Values': len(df_current) - df_current[col].count()
-            })
+        # One vectorized call per statistic instead of per-column scans
+        non_null_counts = df_current.count()
+        unique_counts = df_current.nunique()
+        data_quality_df = pd.DataFrame({
+            'Column Name': df_current.columns,
+            'Data Type': df_current.dtypes.astype(str).values,
+            'Non-Null Count': non_null_counts.values,
+            'Unique Values': unique_counts.values,
+            'Missing Values': len(df_current) - non_null_counts.values
+        })
         
-        st.dataframe(pd.DataFrame(data_quality_df), use_container_width=True)
+        st.dataframe(data_quality_df, use_container_width=True)
 
 
     else:
         st.warning("No historical data loaded. Please upload your file to enable analytics.")
     
+    # --- Cached Upload Cleanup ---
+    # Processed uploads are persisted to the server's disk and are only removed here
+    st.markdown("---")
+    if st.button("🗑️ Clear Cached Uploads", help="Deletes the processed copies of every upload, including those persisted to the server's disk, for all users."):
+        load_and_process_data.clear()
+        load_dataset_by_key.clear()
+        st.session_state['data_key'] = None
+        st.success("Cached uploads cleared. A file still selected above is processed again on the next interaction.")
+    
     display_footer()
 
 
 def page_details():
     st.title("📊 3. Details View: Top & Bottom Performers")
     
-    df = st.session_state.get('analytical_data', pd.DataFrame())
+    df, _, precomputed = get_dataset()
 
     if df.empty:
         st.error("❌ No historical data available. Please upload the data file on the 'Historical Data Uploader & Summary' page.")
@@ -184,15 +392,15 @@ def page_details():
 
     st.markdown("This page provides an overall, high-level view of the best and worst performing **Clients** and **Categories** over the entire 3-year period.")
 
-    # Calculate Client Sales:
-    client_sales = df.groupby('Client_Name')['Quantity_Sold'].sum()
+    # Client Sales (pre-computed at load time):
+    client_sales = precomputed['client_sales']
     
     col1, col2 = st.columns(2)
 
     # --- Top Clients (Most Purchased Quantity) ---
     with col1:
         st.subheader("Top Clients (Most Purchased Quantity)")
-        most_selling_clients = client_sales.sort_values(ascending=False).head(10).reset_index()
+        most_selling_clients = top_n(client_sales).reset_index()
         st.dataframe(
             most_selling_clients.rename(columns={'Quantity_Sold': 'Total Quantity Purchased'}),
             use_container_width=True
@@ -202,7 +410,7 @@ def page_details():
     with col2:
         st.subheader("Bottom Clients (Least Purchased Quantity)")
         # *** LOGIC CONFIRMED: This method correctly isolates the clients with the LOWEST Quantity_Sold. ***
-        least_selling_clients = client_sales.sort_values(ascending=True).head(10).reset_index()
+        least_selling_clients = top_n(client_sales, largest=False).reset_index()
         st.dataframe(
             least_selling_clients.rename(columns={'Quantity_Sold': 'Total Quantity Purchased'}),
             use_container_width=True
@@ -210,15 +418,15 @@ def page_details():
 
     st.markdown("---")
 
-    # Calculate Category Sales:
-    category_sales = df.groupby('Category')['Quantity_Sold'].sum()
+    # Category Sales (pre-computed at load time):
+    category_sales = precomputed['category_sales']
 
     col3, col4 = st.columns(2)
     
     # --- Top Categories (Most Sold Quantity) ---
     with col3:
         st.subheader("Top Categories (Most Sold Quantity)")
-        most_sold_categories = category_sales.sort_values(ascending=False).head(10).reset_index()
+        most_sold_categories = top_n(category_sales).reset_index()
         st.dataframe(
             most_sold_categories.rename(columns={'Quantity_Sold': 'Total Quantity Sold'}),
             use_container_width=True
@@ -228,7 +436,7 @@ def page_details():
     with col4:
         st.subheader("Bottom Categories (Least Sold Quantity)")
         # *** LOGIC CONFIRMED: This method correctly isolates the 10 categories with the LOWEST Quantity_Sold. ***
-        least_sold_categories = category_sales.sort_values(ascending=True).head(10).reset_index()
+        least_sold_categories = top_n(category_sales, largest=False).reset_index()
         st.dataframe(
             least_sold_categories.rename(columns={'Quantity_Sold': 'Total Quantity Sold'}),
             use_container_width=True
@@ -240,8 +448,8 @@ def page_details():
 def page_analytics():
     st.title("📈 4. Three-Year Advanced Time-Series Analytics")
 
-    df = st.session_state.get('analytical_data', pd.DataFrame())
-    store_history_df = st.session_state.get('store_history', pd.DataFrame())
+    df, store_history_df, precomputed = get_dataset()
+    data_key = st.session_state.get('data_key')
 
     if df.empty:
         st.error("❌ No historical data available. Please upload the data file on the 'Historical Data Uploader & Summary' page to run these analytics.")
@@ -251,53 +459,105 @@ def page_analytics():
     st.sidebar.header("Interactive Analytics Filters")
     
     # Time Aggregation (Includes Festival)
-    time_agg_options = {
-        'Monthly': 'Month_Year', 
-        'Yearly': 'Year', 
-        'Seasonal': 'Season', 
-        'Festival': 'Festival' 
-    }
-    selected_time_agg_label = st.sidebar.selectbox("Select Time Aggregation:", list(time_agg_options.keys()))
-    time_col = time_agg_options[selected_time_agg_label]
+    selected_time_agg_label = st.sidebar.selectbox("Select Time Aggregation:", list(TIME_AGG_OPTIONS.keys()))
+    time_col = TIME_AGG_OPTIONS[selected_time_agg_label]
+    
+    # =========================================================
+    # --- Full-Data Graphs (Q3, Q7: independent of the client/category filters) ---
+    # =========================================================
+    
+    # Q3: Client count increase/decrease (monthly, yearly, seasonally)
+    st.header(f"3. Client Growth/Decline ({selected_time_agg_label})")
+    # SIMPLIFIED ENGLISH
+    st.info(f"🎯 **What this shows (Q3):** This tracks the percentage change in the number of **unique clients** buying from us over time. It uses **all data** to show overall market health.")
+    client_growth = precomputed['client_growth_by'][time_col] # Use full data (pre-computed, filter independent)
+    
+    # Small, fixed-shape figure: build the trace straight from NumPy arrays
+    client_change = client_growth['Client_Change_%'].to_numpy()
+    fig2 = go.Figure(go.Bar(
+        x=client_growth[time_col].astype(str).to_numpy(),
+        y=client_change,
+        marker=dict(color=client_change, colorscale=px.colors.sequential.RdBu, showscale=True,
+                    colorbar=dict(title='Client_Change_%')),
+        customdata=client_growth['Client_Count'].to_numpy(),
+        hovertemplate=f'{time_col}=%{{x}}<br>Client_Change_%=%{{y}}<br>Client_Count=%{{customdata}}<extra></extra>',
+    ))
+    fig2.update_layout(title=f'Q3: Client Count Change % ({selected_time_agg_label})',
+                       xaxis_title=time_col, yaxis_title='Client_Change_%',
+                       template='plotly_white')
+    st.plotly_chart(fig2, use_container_width=True)
+
+    # Q7: Customer service lack and decreasing customers (monthly, yearly, seasonally)
+    st.header("7. Customer Service Lack & High-Risk Clients")
+    # SIMPLIFIED ENGLISH
+    st.info("🎯 **What this shows (Q7):** This helps find our **highest-risk clients**. Clients in the **bottom-left** (low sales AND low average service score) are likely leaving because of bad service. We must prioritize keeping these clients.")
+    
+    # Note: built from the full, un-filtered dataframe at load time.
+    service_df = precomputed['service_scatter']
+    
+    # One point per client: a WebGL scatter built from NumPy arrays stays smooth with many clients
+    total_sales = service_df['Total_Sales'].to_numpy()
+    fig5 = go.Figure(go.Scattergl(
+        x=service_df['Avg_Service_Score'].to_numpy(),
+        y=total_sales,
+        mode='markers',
+        # Marker area proportional to Total_Sales, largest marker 40px across
+        marker=dict(size=total_sales, sizemode='area', sizeref=2.0 * max(total_sales.max(), 1) / 40 ** 2, sizemin=4),
+        text=service_df['Client_Name'].astype(str).to_numpy(),
+        hovertemplate='Client_Name=%{text}<br>Avg_Service_Score=%{x:.2f}<br>Total_Sales=%{y:,}<extra></extra>', # Explicit hover data
+    ))
+    fig5.update_layout(title='Q7: Service Score vs. Total Sales (Identify High Risk Clients)',
+                       xaxis_title='Average Service Score (Lower is Riskier)', yaxis_title='Total_Sales',
+                       template='plotly_white')
+    st.plotly_chart(fig5, use_container_width=True)
+    
+    # NOTE VISIBILITY CHANGE: Changed to bold black
+    st.markdown(f"**Note for Q7: To find the decreasing clients by {selected_time_agg_label}, refer to Q3 (Client Count Change) and look for negative bars, then focus on those clients in this scatter plot.**")
+    
+    # --- Filtered Graphs (re-run on their own when the client/category filters change) ---
+    filtered_analytics(df, store_history_df, precomputed, data_key, time_col, selected_time_agg_label)
+    
+    display_footer()
+
+
+@st.fragment
+def filtered_analytics(df, store_history_df, precomputed, data_key, time_col, selected_time_agg_label):
+    """Draws the filter-driven graphs (Q1, Q2, Q4/5/6, Q8, Q9) as a fragment, so changing the
+    client/category filters re-runs only this part of the page."""
+    st.markdown("---")
+    st.subheader("Client & Category Filters")
+    st.info("💡 These filters apply to Q1, Q2, Q4/Q5/Q6, Q8 and Q9 below.")
+    filter_col1, filter_col2 = st.columns(2)
     
     # Dropdown Filters (Includes ALL unique Client Names + 'All')
     clients = ['All'] + sorted(df['Client_Name'].unique().tolist())
     # CONFIRMED: This dropdown contains ALL client names plus 'All'.
-    selected_client = st.sidebar.selectbox("Filter by Client Name:", clients)
+    selected_client = filter_col1.selectbox("Filter by Client Name:", clients)
     
     # Dropdown Filters (Includes ALL unique Category Names + 'All')
     categories = ['All'] + sorted(df['Category'].unique().tolist())
     # CONFIRMED: This dropdown contains ALL category names plus 'All'.
-    selected_category = st.sidebar.selectbox("Filter by Jewellery Category:", categories)
+    selected_category = filter_col2.selectbox("Filter by Jewellery Category:", categories)
 
-    # --- Filtering Logic ---
-    df_filtered = df.copy()
-    if selected_client != 'All':
-        df_filtered = df_filtered[df_filtered['Client_Name'] == selected_client]
-    if selected_category != 'All':
-        df_filtered = df_filtered[df_filtered['Category'] == selected_category]
+    # --- Filtered Aggregations (memoized per data key and filter selection) ---
+    filter_key = (data_key, selected_client, selected_category, time_col)
+    sales_by_time = category_sales_by_time(df, *filter_key)
+    taste_df, taste_clients_omitted = client_taste_by_time(df, *filter_key)
+    price_df = price_band_sales_by_time(df, *filter_key)
     
-    if df_filtered.empty and (selected_client != 'All' or selected_category != 'All'):
+    if sales_by_time.empty and (selected_client != 'All' or selected_category != 'All'):
         st.warning("No data found for the selected combination.")
     
-    # =========================================================
-    # --- Analytical Requirements Implementation (Graphs) ---
-    # =========================================================
-    
     # Q1: Category sales increase/decrease (monthly, client-wise, yearly, seasonally)
     st.header(f"1. Category Sales % Change ({selected_time_agg_label})")
     # SIMPLIFIED ENGLISH
     st.info("🎯 **What this shows (Q1):** This helps you see which product types (like Rings or Bangles) are growing fast or dropping sharply. It uses only the **filtered data**.")
     
-    if df_filtered.empty:
+    if sales_by_time.empty:
         st.warning("Cannot calculate Category Sales Change. Please adjust filters.")
     else:
-        # Aggregate data
-        sales_by_time = df_filtered.groupby([time_col, 'Category'])['Quantity_Sold'].sum().reset_index()
-        sales_by_time['Sales_Change_%'] = sales_by_time.groupby('Category')['Quantity_Sold'].pct_change() * 100
-        sales_by_time = sales_by_time.fillna(0)
-        
-        fig1 = px.line(sales_by_time, 
+        q1_df = plot_frame(sales_by_time, [time_col, 'Category', 'Quantity_Sold', 'Sales_Change_%'], [time_col])
+        fig1 = px.line(q1_df, 
                     x=time_col, 
                     y='Sales_Change_%', 
                     color='Category',
@@ -306,68 +566,44 @@ def page_analytics():
                     template='plotly_white')
         st.plotly_chart(fig1, use_container_width=True)
 
-    # --- Client and Store Growth/Decline Analysis ---
-    st.header(f"2. Store Growth/Decline (Yearly) & 3. Client Growth/Decline ({selected_time_agg_label})")
-    col2_1, col2_2 = st.columns(2)
-    
-    # Q3: Client count increase/decrease (monthly, yearly, seasonally)
-    with col2_1:
-        # SIMPLIFIED ENGLISH
-        st.info(f"🎯 **What this shows (Q3):** This tracks the percentage change in the number of **unique clients** buying from us over time. It uses **all data** to show overall market health.")
-        client_growth = df.groupby(time_col)['Client_Name'].nunique().reset_index() # Use full data
-        client_growth.columns = [time_col, 'Client_Count']
-        client_growth['Client_Change_%'] = client_growth['Client_Count'].pct_change() * 100
-        
-        fig2 = px.bar(client_growth, 
-                      x=time_col, 
-                      y='Client_Change_%', 
-                      color='Client_Change_%',
-                      color_continuous_scale=px.colors.sequential.RdBu,
-                      title=f'Q3: Client Count Change % ({selected_time_agg_label})',
-                      hover_data=['Client_Count'],
-                      template='plotly_white')
-        st.plotly_chart(fig2, use_container_width=True)
-
     # Q2: Store count increase/decrease (yearly is most logical for store openings)
-    with col2_2:
-        # SIMPLIFIED ENGLISH
-        st.info("🎯 **What this shows (Q2):** This tracks if our client network is growing (more stores opening) or shrinking (stores closing) each year. It uses **Store History data**.")
-        if not store_history_df.empty:
-            stores_df = store_history_df.copy()
-            if selected_client != 'All':
-                stores_df = stores_df[stores_df['Client_Name'] == selected_client]
-
-            stores_df_agg = stores_df.groupby('Year')['Store_Count'].sum().reset_index()
-            fig3 = px.bar(stores_df_agg, 
-                          x='Year', 
-                          y='Store_Count', 
-                          title=f'Q2: Total Stores Active (Yearly - Filtered by Client)',
-                          hover_data=['Store_Count'],
-                          template='plotly_white')
-            st.plotly_chart(fig3, use_container_width=True)
-            # NOTE VISIBILITY CHANGE: Changed to bold black
-            st.markdown("**Note: The sales impact of store growth is also covered in Q1, Q4, and Q8.**")
-        else:
-            st.warning("Store history data is not available.")
+    st.header("2. Store Growth/Decline (Yearly)")
+    # SIMPLIFIED ENGLISH
+    st.info("🎯 **What this shows (Q2):** This tracks if our client network is growing (more stores opening) or shrinking (stores closing) each year. It uses **Store History data**.")
+    if not store_history_df.empty:
+        stores_df = store_history_df.copy()
+        if selected_client != 'All':
+            stores_df = stores_df[stores_df['Client_Name'] == selected_client]
+
+        stores_df_agg = stores_df.groupby('Year', observed=True)['Store_Count'].sum().reset_index()
+        fig3 = px.bar(stores_df_agg, 
+                      x='Year', 
+                      y='Store_Count', 
+                      title=f'Q2: Total Stores Active (Yearly - Filtered by Client)',
+                      hover_data=['Store_Count'],
+                      template='plotly_white')
+        st.plotly_chart(fig3, use_container_width=True)
+        # NOTE VISIBILITY CHANGE: Changed to bold black
+        st.markdown("**Note: The sales impact of store growth is also covered in Q1, Q4, and Q8.**")
+    else:
+        st.warning("Store history data is not available.")
 
 
     st.header(f"4/5/6. Client Taste, Seasonal, and Festival Needs ({selected_time_agg_label})")
     # SIMPLIFIED ENGLISH
     st.info("🎯 **What this shows (Q4, Q5, Q6):** This Treemap is a powerful chart that shows what products are most popular (largest boxes) by Client during the selected time period (Month/Year/Season/Festival). This is **critical** for inventory planning. It uses **filtered data**.")
     
-    if df_filtered.empty:
+    if taste_df.empty:
         st.warning("Cannot calculate Client Taste. Please adjust filters.")
     else:
-        # Use filtered data to show the taste of the selected client/category
-        taste_df = df_filtered.groupby(['Client_Name', time_col, 'Category'])['Quantity_Sold'].sum().reset_index()
-        
         # Adjust path based on filters
         treemap_path = [time_col, 'Client_Name', 'Category']
         if selected_client != 'All':
              # If a specific client is selected, remove Client_Name from the path to focus on time/category
             treemap_path = [time_col, 'Category'] 
 
-        fig4 = px.treemap(taste_df, 
+        q4_df = plot_frame(taste_df, ['Client_Name', time_col, 'Category', 'Quantity_Sold'], [time_col, 'Client_Name', 'Category'])
+        fig4 = px.treemap(q4_df, 
                           path=treemap_path, 
                           values='Quantity_Sold',
                           title=f'Q4/Q5/Q6: Client Taste and Needs Breakdown ({selected_time_agg_label})',
@@ -376,43 +612,20 @@ def page_analytics():
                           hover_data=['Client_Name', 'Category', 'Quantity_Sold'], # Added hover details
                           template='plotly_white')
         st.plotly_chart(fig4, use_container_width=True)
+        if taste_clients_omitted:
+            st.caption(f"Showing the top {TREEMAP_TOP_CLIENTS} clients by quantity sold. Select a client to see their full breakdown.")
 
-    # Q7: Customer service lack and decreasing customers (monthly, yearly, seasonally)
-    st.header("7. Customer Service Lack & High-Risk Clients")
-    # SIMPLIFIED ENGLISH
-    st.info("🎯 **What this shows (Q7):** This helps find our **highest-risk clients**. Clients in the **bottom-left** (low sales AND low average service score) are likely leaving because of bad service. We must prioritize keeping these clients.")
-    
-    # Note: df is the full, un-filtered dataframe.
-    service_df = df.groupby('Client_Name').agg( 
-        Avg_Service_Score=('Customer_Service_Score', 'mean'),
-        Total_Sales=('Quantity_Sold', 'sum')
-    ).reset_index()
-    
-    fig5 = px.scatter(service_df, 
-                      x='Avg_Service_Score', 
-                      y='Total_Sales', 
-                      size='Total_Sales', 
-                      color='Client_Name',
-                      hover_data=['Client_Name', 'Avg_Service_Score', 'Total_Sales'], # Explicit hover data
-                      title='Q7: Service Score vs. Total Sales (Identify High Risk Clients)',
-                      labels={'Avg_Service_Score': 'Average Service Score (Lower is Riskier)'},
-                      template='plotly_white')
-    st.plotly_chart(fig5, use_container_width=True)
-    
-    # NOTE VISIBILITY CHANGE: Changed to bold black
-    st.markdown(f"**Note for Q7: To find the decreasing clients by {selected_time_agg_label}, refer to Q3 (Client Count Change) and look for negative bars, then focus on those clients in this scatter plot.**")
-    
     # Q8: Making of jewellery category wise increasing or decreasing (monthly, yearly, seasonally)
     st.header(f"8. Jewellery Making Trend (Category Volume - {selected_time_agg_label})")
     # SIMPLIFIED ENGLISH
     st.info("🎯 **What this shows (Q8):** This chart shows how much we need to produce for different jewellery categories over time. It's a direct guide for **production and supply planning**. It uses **filtered data**.")
 
-    if df_filtered.empty:
+    if sales_by_time.empty:
         st.warning("Cannot calculate Jewellery Making Trend. Please adjust filters.")
     else:
-        production_df = df_filtered.groupby([time_col, 'Category'])['Quantity_Sold'].sum().reset_index()
-        
-        fig6 = px.bar(production_df, 
+        # Same (time, category) totals as Q1
+        q8_df = plot_frame(sales_by_time, [time_col, 'Category', 'Quantity_Sold'], [time_col])
+        fig6 = px.bar(q8_df, 
                           x=time_col, 
                           y='Quantity_Sold', 
                           color='Category',
@@ -427,31 +640,28 @@ def page_analytics():
     # SIMPLIFIED ENGLISH
     st.info("🎯 **What this shows (Q9):** This determines where most of our sales volume comes from: **Low, Medium, or High price bands**. This is key for **pricing new products**. It uses **filtered data**.")
     
-    if df_filtered.empty:
+    if price_df.empty:
         st.warning("Cannot calculate Preferred Price Range. Please adjust filters.")
     else:
-        price_df = df_filtered.groupby(['Price_Band', time_col])['Quantity_Sold'].sum().reset_index()
-        
-        fig7 = px.bar(price_df, 
+        q9_df = plot_frame(price_df, ['Price_Band', time_col, 'Quantity_Sold'], [time_col])
+        fig7 = px.bar(q9_df, 
                           x='Price_Band', 
                           y='Quantity_Sold', 
                           color=time_col,
                           barmode='group',
                           title=f'Q9: Preferred Price Band by Client ({selected_time_agg_label})',
                           labels={'Quantity_Sold': 'Total Quantity Sold'},
-                          # Ensure correct order for Price_Band as defined in the data description
-                          category_orders={'Price_Band': df['Price_Band'].unique().tolist()},
+                          # Ensure correct order for Price_Band (ordered categorical set at load time)
+                          category_orders={'Price_Band': list(df['Price_Band'].cat.categories)},
                           hover_data=['Price_Band', 'Quantity_Sold'],
                           template='plotly_white')
         st.plotly_chart(fig7, use_container_width=True)
     
-    display_footer()
-
 
 def page_conclusion():
     st.title("🏆 5. Strategic Command Center: Actionable Insights")
     
-    df = st.session_state.get('analytical_data', pd.DataFrame())
+    df, _, _ = get_dataset()
 
     if df.empty:
         st.error("❌ Please upload and process the data on the previous pages to generate meaningful conclusions.")
@@ -581,11 +791,9 @@ def page_conclusion():
 
 # --- Main App Logic and Navigation ---
 
-# Initialization for data storage
-if 'analytical_data' not in st.session_state:
-    st.session_state['analytical_data'] = pd.DataFrame()
-if 'store_history' not in st.session_state:
-    st.session_state['store_history'] = pd.DataFrame()
+# Initialization for data storage (a reference to the shared processed data, see load_dataset_by_key)
+if 'data_key' not in st.session_state:
+    st.session_state['data_key'] = None
 
 # Define the pages and their functions
 page_names_to_funcs = {